@@ -1,27 +1,27 @@
+import re
 import os
 import json
+import hashlib
 import time
 import math
+import atexit
 import pickle
+import tempfile
+import threading
 import pygame
 import random
 import numpy as np
 import pandas as pd
-import altair as alt
 from PIL import Image
 import datetime as dt
 import itertools as it
 import streamlit as st
-import plotly.express as px
 from datetime import datetime
+from collections import OrderedDict
 from textblob import TextBlob
 from dotenv import load_dotenv
-from scipy.stats import entropy
-from langchain_openai import ChatOpenAI
-from langchain.chains import RetrievalQA
-from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings  # Updated import
+from scipy import sparse
+from numba import njit, prange
 
 st.set_page_config(
     page_title="Cheatdle",
@@ -42,21 +42,23 @@ LONG_WORD_LIST_FILE = "data/wordle-answers.txt"  # possible answers
 WORD_FREQ_FILE = "data/freq_map.json"
 PATTERN_MATRIX_FILE = "data/pattern_matrix.npy"
 ENT_SCORE_PAIRS_FILE = "data/ent_score_pairs.json"
+NEXT_GUESS_MAP_FILE = "data/next_guess_map.pkl"
+NEXT_GUESS_MAP_VERSION = 1  # Bump whenever the map's keys or entries change
 
 PATTERN_GRID_DATA = dict()
+NEXT_GUESS_MAP_SIZE = 100000
+NEXT_GUESS_MAP_SAVE_INTERVAL = 60  # Seconds between saves of the map to file
 CHUNK_LENGTH = 13000
 
-
-def chunks(lst, n):
-    """Yield successive n-sized chunks from lst."""
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
+# Place values of each letter position in a ternary pattern
+POW3 = np.array([1, 3, 9, 27, 81], dtype=np.uint8)
 
 
 def sigmoid(x):
     return 1 / (1 + math.exp(-x))
 
 
+@st.cache_data
 def get_word_list(short=False):
     result = []
     file = SHORT_WORD_LIST_FILE if short else LONG_WORD_LIST_FILE
@@ -86,6 +88,7 @@ def get_word_frequencies(regenerate=False):
     return freq_map
 
 
+@st.cache_data
 def get_frequency_based_priors(n_common=3000, width_under_sigmoid=10):
     freq_map = get_word_frequencies()
     words = np.array(list(freq_map.keys()))
@@ -115,73 +118,108 @@ def get_true_wordle_prior():
 
 
 def get_possible_words(guess, pattern, word_list):
-    all_patterns = get_pattern_matrix([guess], word_list).flatten()
-    return list(np.array(word_list)[all_patterns == pattern])
+    load_pattern_grid_data()
+    words_to_index = PATTERN_GRID_DATA['words_to_index']
+    # A single row of the grid holds the patterns of guess against every word
+    row = PATTERN_GRID_DATA['grid'][words_to_index[guess]]
+    if is_full_word_list(word_list):
+        # word_list is the grid's own word list, so it lines up with the row
+        return PATTERN_GRID_DATA['words'][row == pattern]
+    return np.asarray(word_list)[row[get_word_indices(word_list)] == pattern]
 
 
 def get_weights(words, priors):
     frequencies = np.array([priors[word] for word in words])
     total = frequencies.sum()
     if total == 0:
-        return np.zeros(frequencies.shape)
-    return frequencies / total
+        return np.zeros(frequencies.shape, dtype=np.float32)
+    return (frequencies / total).astype(np.float32)
 
 
 def words_to_int_arrays(words):
     return np.array([[ord(c)for c in w] for w in words], dtype=np.uint8)
 
 
+def pack_int_arrays(word_arr):
+    # Pack the letters of each word into the low bytes of a single uint64,
+    # so that words can be compared a whole word at a time.
+    shifts = 8 * np.arange(word_arr.shape[1], dtype=np.uint64)
+    return np.bitwise_or.reduce(word_arr.astype(np.uint64) << shifts, axis=1)
+
+
+def get_pattern_encoding():
+    # Lookup table from (green_mask << 5 | yellow_mask), where bit i of each
+    # mask flags letter position i, to the ternary pattern integer
+    keys = np.arange(1 << 10)[:, np.newaxis]
+    positions = np.arange(5)
+    green = keys >> (positions + 5) & 1
+    yellow = keys >> positions & 1
+    colors = np.where(green, EXACT, np.where(yellow, MISPLACED, 0)).astype(np.uint8)
+    # The largest pattern is 3**5 - 1, so the sum never overflows a uint8
+    return (colors * POW3).sum(axis=-1, dtype=np.uint8)
+
+
+PATTERN_ENCODING = get_pattern_encoding()
+
+# Byte masks for comparing all five letters of two packed words at once
+LOW_BITS = np.uint64(0x7F7F7F7F7F)
+HIGH_BITS = np.uint64(0x8080808080)
+ONE_BYTES = np.uint64(0x0101010101)
+
+
+@njit(inline='always')
+def zero_byte_mask(x):
+    # Returns a 5-bit mask whose bit i is set when byte i of x is zero.
+    # Letters are ASCII, so the high bit of each byte is free and the
+    # addition can't carry from one byte into the next.
+    z = ~(((x & LOW_BITS) + LOW_BITS) | x) & HIGH_BITS
+    z >>= np.uint64(7)
+    z |= (z >> np.uint64(7)) | (z >> np.uint64(14)) | (z >> np.uint64(21)) | (z >> np.uint64(28))
+    return np.int64(z & np.uint64(0x1F))
+
+
+@njit(parallel=True, cache=True, fastmath=True)
+def pattern_matrix_kernel(packed1, packed2, out):
+    # out[a, b] is the ternary pattern for guess a and answer b, looked up
+    # from the masks of green and yellow letter positions.
+    # used_answer is a bitmask of answer letters which have already been
+    # matched, so they won't trigger the yellow pass again.
+    for a in prange(packed1.shape[0]):
+        guess = packed1[a]
+        for b in range(packed2.shape[0]):
+            answer = packed2[b]
+
+            # Green pass
+            green = zero_byte_mask(guess ^ answer)
+            used_answer = green
+
+            # Yellow pass
+            yellow = 0
+            for i in range(5):
+                if green & (1 << i):
+                    continue
+                # Broadcast guess letter i to every byte, then find the
+                # answer positions holding that same letter
+                letter = (guess >> np.uint64(8 * i)) & np.uint64(0xFF)
+                matches = zero_byte_mask((letter * ONE_BYTES) ^ answer) & ~used_answer
+                if matches:
+                    yellow |= 1 << i
+                    used_answer |= matches & -matches
+
+            out[a, b] = PATTERN_ENCODING[green << 5 | yellow]
+
+
 def generate_pattern_matrix(words1, words2):
-    # Number of letters/words
-    nl = len(words1[0])
-    nw1 = len(words1)  # Number of words
-    nw2 = len(words2)  # Number of words
-
-    # Convert word lists to integer arrays
-    word_arr1, word_arr2 = map(words_to_int_arrays, (words1, words2))
-
-    # equality_grid keeps track of all equalities between all pairs
-    # of letters in words. Specifically, equality_grid[a, b, i, j]
-    # is true when words[i][a] == words[b][j]
-    equality_grid = np.zeros((nw1, nw2, nl, nl), dtype=bool)
-    for i, j in it.product(range(nl), range(nl)):
-        equality_grid[:, :, i, j] = np.equal.outer(
-            word_arr1[:, i], word_arr2[:, j])
-
-    # full_pattern_matrix[a, b] should represent the 5-color pattern
-    # for guess a and answer b, with 0 -> grey, 1 -> yellow, 2 -> green
-    full_pattern_matrix = np.zeros((nw1, nw2, nl), dtype=np.uint8)
-
-    # Green pass
-    for i in range(nl):
-        # matches[a, b] is true when words[a][i] = words[b][i]
-        matches = equality_grid[:, :, i, i].flatten()
-        full_pattern_matrix[:, :, i].flat[matches] = EXACT
-
-        for k in range(nl):
-            # If it's a match, mark all elements associated with
-            # that letter, both from the guess and answer, as covered.
-            # That way, it won't trigger the yellow pass.
-            equality_grid[:, :, k, i].flat[matches] = False
-            equality_grid[:, :, i, k].flat[matches] = False
-
-    # Yellow pass
-    for i, j in it.product(range(nl), range(nl)):
-        matches = equality_grid[:, :, i, j].flatten()
-        full_pattern_matrix[:, :, i].flat[matches] = MISPLACED
-        for k in range(nl):
-            # Similar to above, we want to mark this letter
-            # as taken care of, both for answer and guess
-            equality_grid[:, :, k, j].flat[matches] = False
-            equality_grid[:, :, i, k].flat[matches] = False
+    # Convert word lists to integer arrays, packed one word per uint64
+    packed1, packed2 = (
+        pack_int_arrays(words_to_int_arrays(words)) for words in (words1, words2)
+    )
 
     # Rather than representing a color pattern as a lists of integers,
     # store it as a single integer, whose ternary representations corresponds
     # to that list of integers.
-    pattern_matrix = np.dot(
-        full_pattern_matrix,
-        (3**np.arange(nl)).astype(np.uint8)
-    )
+    pattern_matrix = np.zeros((len(words1), len(words2)), dtype=np.uint8)
+    pattern_matrix_kernel(packed1, packed2, pattern_matrix)
 
     return pattern_matrix
 
@@ -195,22 +233,19 @@ def get_pattern(guess, answer):
 
 
 def generate_pattern_matrix_in_blocks(many_words1, many_words2, block_length=CHUNK_LENGTH):
-    block_matrix = None
-    for words1 in chunks(many_words1, block_length):
-        row = None
-
-        for words2 in chunks(many_words2, block_length):
-            block = generate_pattern_matrix(words1, words2)
-
-            if row is None:
-                row = block
-            else:
-                row = np.hstack((row, block))
-
-        if block_matrix is None:
-            block_matrix = row
-        else:
-            block_matrix = np.vstack((block_matrix, row))
+    # Pack both word lists once, then have the kernel fill each block straight
+    # into its slice of the full matrix, rather than stacking up copies
+    packed1, packed2 = (
+        pack_int_arrays(words_to_int_arrays(words)) for words in (many_words1, many_words2)
+    )
+    block_matrix = np.zeros((len(packed1), len(packed2)), dtype=np.uint8)
+    for i in range(0, len(packed1), block_length):
+        for j in range(0, len(packed2), block_length):
+            pattern_matrix_kernel(
+                packed1[i:i + block_length],
+                packed2[j:j + block_length],
+                block_matrix[i:i + block_length, j:j + block_length]
+            )
 
     return block_matrix
 
@@ -223,54 +258,103 @@ def generate_full_pattern_matrix():
     return pattern_matrix
 
 
-def get_pattern_matrix(words1, words2):
+def load_pattern_grid_data():
     if not PATTERN_GRID_DATA:
         if not os.path.exists(PATTERN_MATRIX_FILE):
             print("Generating pattern matrix. This takes a minute, but",
                   "the result will be saved to file so that it only",
                   "needs to be computed once.")
             generate_full_pattern_matrix()
-        PATTERN_GRID_DATA['grid'] = np.load(PATTERN_MATRIX_FILE)
+        words = get_word_list()
+        # Memory-map the grid, so only the rows that are read get paged in
+        PATTERN_GRID_DATA['grid'] = np.load(PATTERN_MATRIX_FILE, mmap_mode='r')
+        PATTERN_GRID_DATA['words'] = np.array(words)
         PATTERN_GRID_DATA['words_to_index'] = dict(zip(
-            get_word_list(), it.count()
+            words, it.count()
         ))
+        # Sorted copy of the words for binary searches, along with where
+        # each sorted word sits in the grid
+        sort_order = np.argsort(PATTERN_GRID_DATA['words'])
+        PATTERN_GRID_DATA['sorted_words'] = PATTERN_GRID_DATA['words'][sort_order]
+        PATTERN_GRID_DATA['sort_order'] = sort_order
+    return PATTERN_GRID_DATA
+
+
+def is_full_word_list(words):
+    # Whether words is the grid's own word list, in the grid's order. Lists
+    # of the same length but in another order don't line up with the grid.
+    full_words = load_pattern_grid_data()['words']
+    return words is full_words or (
+        len(words) == len(full_words) and np.array_equal(words, full_words))
+
+
+def get_word_indices(words):
+    # Indices of words into the pattern grid. The grid's own word list maps
+    # onto the grid as it is, and any other list is found with one vectorized
+    # binary search rather than a dict lookup per word.
+    load_pattern_grid_data()
+    if is_full_word_list(words):
+        return slice(None)
+    sorted_words = PATTERN_GRID_DATA['sorted_words']
+    positions = np.searchsorted(sorted_words, words)
+    # A word missing from the grid lands next to where it would sort, so
+    # check every position really holds its word
+    found = sorted_words[np.minimum(positions, len(sorted_words) - 1)] == words
+    if not np.all(found):
+        raise KeyError(str(np.asarray(words)[~found][0]))
+    return PATTERN_GRID_DATA['sort_order'][positions]
+
+
+@st.cache_resource
+def get_pattern_indicators():
+    # Sparse 0/1 matrix with a row for every (guess, pattern) pair and a
+    # column for every answer, so that multiplying it by the answer weights
+    # sums them into the pattern distributions of every guess at once.
+    # It's stored by column, since each turn only keeps some of the answers.
+    # The grid never changes, so the matrix is built once per process and
+    # shared by every rerun and session.
+    grid = load_pattern_grid_data()['grid']
+    n1, n2 = grid.shape
+    rows = np.arange(n1)[:, np.newaxis] * 3**5 + grid
+    return sparse.csc_matrix(
+        (
+            np.ones(n1 * n2, dtype=np.float32),
+            rows.T.ravel().astype(np.int32),
+            np.arange(0, n1 * n2 + 1, n1)
+        ),
+        shape=(n1 * 3**5, n2)
+    )
 
-    full_grid = PATTERN_GRID_DATA['grid']
-    words_to_index = PATTERN_GRID_DATA['words_to_index']
 
-    indices1 = [words_to_index[w] for w in words1]
-    indices2 = [words_to_index[w] for w in words2]
-    return full_grid[np.ix_(indices1, indices2)]
+def get_pattern_matrix(words1, words2):
+    load_pattern_grid_data()
 
+    full_grid = PATTERN_GRID_DATA['grid']
 
-def pattern_to_int_list(pattern):
-    result = []
-    curr = pattern
-    for x in range(5):
-        result.append(curr % 3)
-        curr = curr // 3
-    return result
+    indices1 = get_word_indices(words1)
+    indices2 = get_word_indices(words2)
+    return full_grid[indices1][:, indices2]
 
 
 def get_pattern_distributions(allowed_words, possible_words, weights):
-    pattern_matrix = get_pattern_matrix(allowed_words, possible_words)
-
-    n = len(allowed_words)
-    distributions = np.zeros((n, 3**5))
-    n_range = np.arange(n)
-    for j, prob in enumerate(weights):
-        distributions[n_range, pattern_matrix[:, j]] += prob
-    return distributions
+    indicators = get_pattern_indicators()[:, get_word_indices(possible_words)]
+    # A single sparse matrix-vector product gives the distributions of every
+    # guess, from which the allowed guesses' rows are picked out
+    distributions = indicators @ weights.astype(np.float32, copy=False)
+    return distributions.reshape((-1, 3**5))[get_word_indices(allowed_words)]
 
 
 def entropy_of_distributions(distributions, atol=1e-12):
-    axis = len(distributions.shape) - 1
-    return entropy(distributions, base=2, axis=axis)
+    # Distributions are already normalized, so the entropy is just
+    # -sum(p * log2(p)) over the last axis, skipping the empty patterns
+    log_probs = np.zeros(distributions.shape, dtype=distributions.dtype)
+    np.log2(distributions, out=log_probs, where=distributions > atol)
+    return -(distributions * log_probs).sum(axis=-1)
 
 
 def get_entropies(allowed_words, possible_words, weights):
     if weights.sum() == 0:
-        return np.zeros(len(allowed_words))
+        return np.zeros(len(allowed_words), dtype=np.float32)
     distributions = get_pattern_distributions(
         allowed_words, possible_words, weights)
     return entropy_of_distributions(distributions)
@@ -299,27 +383,135 @@ def optimal_guess(allowed_words, possible_words, priors):
 
 # Begin guess functions:
 
+def get_state_key(possibilities, choices, hard_mode):
+    # The next guess only depends on the words still possible and the words
+    # allowed as guesses, so the state is keyed on a digest of their sorted
+    # grid indices. Outside hard mode every answer is allowed, so the mode
+    # alone stands in for the choices.
+    load_pattern_grid_data()
+    all_indices = np.arange(len(PATTERN_GRID_DATA['words']), dtype=np.int32)
+    parts = [[len(possibilities), int(hard_mode)],
+             np.sort(all_indices[get_word_indices(possibilities)])]
+    if hard_mode:
+        parts.append(np.sort(all_indices[get_word_indices(choices)]))
+    key = np.concatenate(parts).astype(np.int32)
+    return hashlib.sha256(key.tobytes()).digest()
+
+
+def get_next_guess_map_fingerprint():
+    # Saved guesses only hold for the word lists and priors they were worked
+    # out from, so the map file is stamped with a digest of them
+    digest = hashlib.sha256(str(NEXT_GUESS_MAP_VERSION).encode())
+    digest.update('\n'.join(load_pattern_grid_data()['words']).encode())
+    with open('data/wordle-answers.txt', 'rb') as fp:
+        digest.update(fp.read())
+    digest.update(json.dumps(get_frequency_based_priors(), sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+@st.cache_resource
+def load_next_guess_map():
+    # The next guess for a game state is the same for every player, so one
+    # map, kept in least recently used order, is shared by every session of
+    # the process and saved to file between restarts. A missing, unreadable
+    # or out of date file just starts the map off empty.
+    fingerprint = get_next_guess_map_fingerprint()
+    next_guess_map = OrderedDict()
+    try:
+        with open(NEXT_GUESS_MAP_FILE, 'rb') as fp:
+            saved = pickle.load(fp)
+        if saved['fingerprint'] == fingerprint:
+            next_guess_map.update(saved['map'])
+    except Exception:
+        next_guess_map.clear()
+    shared = {
+        'map': next_guess_map,
+        'fingerprint': fingerprint,
+        'lock': threading.Lock(),
+        'save_lock': threading.Lock(),
+        'saved_at': time.monotonic(),
+    }
+    # Keep whatever was added since the last save when the process exits
+    atexit.register(write_next_guess_map, shared)
+    return shared
+
+
+def write_next_guess_map(shared):
+    # Pickle a copy of the map into a temporary file of our own, then swap
+    # it in, so that a crash or another writer never leaves a broken file
+    with shared['lock']:
+        saved = {'fingerprint': shared['fingerprint'], 'map': dict(shared['map'])}
+    fd, tmp_file = tempfile.mkstemp(
+        dir=os.path.dirname(NEXT_GUESS_MAP_FILE), prefix='next_guess_map.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            pickle.dump(saved, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, NEXT_GUESS_MAP_FILE)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+
+def save_next_guess_map(shared):
+    # Saves are throttled and written from a background thread, since
+    # pickling a full map takes seconds. Only one save runs at a time.
+    if time.monotonic() - shared['saved_at'] < NEXT_GUESS_MAP_SAVE_INTERVAL:
+        return
+    if not shared['save_lock'].acquire(blocking=False):
+        return
+    shared['saved_at'] = time.monotonic()
+
+    def save():
+        try:
+            write_next_guess_map(shared)
+        finally:
+            shared['save_lock'].release()
+
+    threading.Thread(target=save, daemon=True).start()
+
+
 def get_next_guess(guesses, patterns, possibilities):
-    phash = "".join(
-        str(g) + "".join(map(str, pattern_to_int_list(p)))
-        for g, p in zip(guesses, patterns)
-    )
-    if phash not in st.session_state["next_guess_map"]:
-        choices = st.session_state["DICT_ANSWERS"]
-        if st.session_state["hard_mode"]:
-            for guess, pattern in zip(guesses, patterns):
-                choices = get_possible_words(guess, pattern, choices)
-        st.session_state["next_guess_map"][phash] = optimal_guess(
+    choices = st.session_state["DICT_ANSWERS"]
+    if st.session_state["hard_mode"]:
+        for guess, pattern in zip(guesses, patterns):
+            choices = get_possible_words(guess, pattern, choices)
+    key = get_state_key(possibilities, choices, st.session_state["hard_mode"])
+    shared = load_next_guess_map()
+    next_guess_map = shared['map']
+    with shared['lock']:
+        entry = next_guess_map.get(key)
+        if entry is not None:
+            next_guess_map.move_to_end(key)
+    if entry is None:
+        next_guess = optimal_guess(
             choices, possibilities, st.session_state["priors"]
         )
+        entry = (str(next_guess), st.session_state["suggestions"])
+        with shared['lock']:
+            next_guess_map[key] = entry
+            next_guess_map.move_to_end(key)
+            # Drop the least recently used states once the map is full
+            while len(next_guess_map) > NEXT_GUESS_MAP_SIZE:
+                next_guess_map.popitem(last=False)
+        save_next_guess_map(shared)
+    next_guess, st.session_state["suggestions"] = entry
+    return next_guess
 
 
 def analyze_guesses(guess, possibilities):
     pattern = get_pattern(guess, st.session_state["answer"])
-    st.session_state["patterns"].append(pattern)
+    # This runs again for the last guess on every rerun, so only record
+    # its pattern the first time through
+    if len(st.session_state["patterns"]) < len(st.session_state["guesses"]):
+        st.session_state["patterns"].append(pattern)
 
     possibilities = get_possible_words(guess, pattern, possibilities)
 
+    # Suggestions are only shown while the game is on and at least three
+    # answers are left, otherwise the remaining answers are listed instead
+    if st.session_state["game_over"] or len(possibilities) < 3:
+        return possibilities
+
     get_next_guess(st.session_state["guesses"],
                    st.session_state["patterns"], possibilities)
     return possibilities
@@ -340,6 +532,7 @@ def get_stats(data):
     return stats
 
 
+@st.cache_data
 def load_dict(file_name, upper=True):
     # Function to load dictionary
     if upper:
@@ -387,7 +580,6 @@ if "guesses" not in st.session_state:
     st.session_state["game_won"] = False
     st.session_state["hard_mode"] = False
     st.session_state["priors"] = get_frequency_based_priors()
-    st.session_state["next_guess_map"] = {}
     st.session_state["patterns"] = []
     st.session_state["possibilities"] = list(
         filter(lambda w: st.session_state["priors"][w] > 0, st.session_state["DICT_ANSWERS"]))
@@ -559,7 +751,6 @@ with wordle:
         st.session_state["game_over"] = False
         st.session_state["game_won"] = False
         st.session_state["priors"] = get_frequency_based_priors()
-        st.session_state["next_guess_map"] = {}
         st.session_state["patterns"] = []
         st.session_state["possibilities"] = list(
             filter(lambda w: st.session_state["priors"][w] > 0, st.session_state["DICT_ANSWERS"]))
@@ -666,7 +857,7 @@ with wordle:
 
         if len(st.session_state["guesses"]) > 0:
             st.session_state["possibilities"] = analyze_guesses(
-                st.session_state["guesses"][-1], st.session_state["possibilities"])
+                st.session_state["guesses"][-1], st.session_state["possibilities"]).tolist()
 
         if not st.session_state["game_over"]:
             if len(st.session_state["possibilities"]) < 3:
@@ -688,6 +879,33 @@ with wordle:
         if st.checkbox(label="Show Possible Answers"):
             st.write(st.session_state["possibilities"])
 
+@st.cache_data
+def load_tweets():
+    return pd.read_csv("data/tweets.zip")
+
+
+@st.cache_data
+def load_words_freq():
+    return pd.read_csv("data/words_freq.csv")
+
+
+# Lines of a tweet which belong to the shared Wordle grid
+GRID_LINE = re.compile(r'\s*(?:Wordle|⬛|⬜|🟨|🟩)')
+
+
+# plotly is slow to import and only needed once a word has been entered,
+# so its modules are imported on first use and shared from then on
+@st.cache_resource
+def load_plotly():
+    import plotly.express as px
+    return px
+
+
+@st.cache_resource
+def load_graph_objects():
+    import plotly.graph_objects as go
+    return go
+
 with sentiment:
     st.header("🚀 Sentiment Analysis")
     st.markdown(
@@ -699,8 +917,8 @@ with sentiment:
 
     # Load datasets
     try:
-        words_freq = pd.read_csv("data/words_freq.csv")
-        tweets = pd.read_csv("data/tweets.zip")
+        words_freq = load_words_freq()
+        tweets = load_tweets()
     except FileNotFoundError as e:
         st.error(f"Error: {e}. Ensure the file paths are correct.")
         st.stop()
@@ -728,32 +946,24 @@ with sentiment:
                 with st.spinner(f"Analyzing tweets for {word.upper()}..."):
                     time.sleep(3)
                     # Sentiment Analysis
-                    sentiments = {"positive": 0, "negative": 0}
-                    polarity_scores = []
-
-                    for _, row in wordle_tweets.iterrows():
-                        text = row["tweet_text"]
-                        # Skip grid-only tweets
-                        if text.count('\n') <= 1 and text.startswith("Wordle"):
-                            continue
-
-                        cleaned_text = ' '.join([
-                            line for line in text.split('\n')
-                            if not line.strip().startswith(('Wordle', '⬛', '⬜', '🟨', '🟩'))
-                        ])
-
-                        if cleaned_text.strip():
-                            analysis = TextBlob(cleaned_text)
-                            polarity = analysis.sentiment.polarity
-                            # Force non-zero polarity
-                            if polarity == 0:
-                                polarity = 0.001  # Slightly positive by default
-                            
-                            polarity_scores.append(polarity)
-                            if polarity > 0:
-                                sentiments["positive"] += 1
-                            else:
-                                sentiments["negative"] += 1
+                    texts = wordle_tweets["tweet_text"]
+                    # Skip grid-only tweets
+                    texts = texts[~(texts.str.startswith("Wordle") & (texts.str.count('\n') <= 1))]
+
+                    # Drop the grid lines of each tweet and join the rest back up
+                    lines = texts.str.split('\n').explode()
+                    lines = lines[~lines.str.match(GRID_LINE)]
+                    cleaned_texts = lines.groupby(level=0).agg(' '.join)
+                    cleaned_texts = cleaned_texts[cleaned_texts.str.strip() != '']
+
+                    polarity_scores = cleaned_texts.map(
+                        lambda text: TextBlob(text).sentiment.polarity).to_numpy(dtype=float)
+                    # Force non-zero polarity
+                    polarity_scores[polarity_scores == 0] = 0.001  # Slightly positive by default
+                    sentiments = {
+                        "positive": int((polarity_scores > 0).sum()),
+                        "negative": int((polarity_scores < 0).sum())
+                    }
 
                     if sum(sentiments.values()) > 0:
                         analyzed_real_tweets = True
@@ -774,7 +984,7 @@ with sentiment:
                         # Sentiment Polarity Distribution
                         st.markdown("### Sentiment Polarity Distribution")
                         polarity_data = pd.DataFrame({"Polarity": polarity_scores})
-                        fig = px.histogram(
+                        fig = load_plotly().histogram(
                             polarity_data,
                             x="Polarity",
                             nbins=20,
@@ -826,7 +1036,7 @@ with sentiment:
                 # Sentiment Polarity Distribution
                 st.markdown("### Sentiment Polarity Distribution")
                 polarity_data = pd.DataFrame({"Polarity": polarity_scores})
-                fig = px.histogram(
+                fig = load_plotly().histogram(
                     polarity_data,
                     x="Polarity",
                     nbins=20,
@@ -839,14 +1049,153 @@ with sentiment:
                 )
                 st.plotly_chart(fig, use_container_width=True)
 
+# The ranking tables are read with their column types given up front and
+# sorted by score once when loaded, so that get_bounds can binary search
+# their scores as they are
+@st.cache_data
+def load_countries():
+    return pd.read_csv("data/countries.csv", dtype={"Country": "string", "Score": "float32", "Code": "string"}).sort_values("Score", ignore_index=True)
+
+
+@st.cache_data
+def load_global_cities():
+    return pd.read_csv("data/top10_global_cities.csv", dtype={"City": "string", "Score": "float32"}).sort_values("Score", ignore_index=True)
+
+
+@st.cache_data
+def load_us_cities():
+    return pd.read_csv("data/top10_us_cities.csv", dtype={"City": "string", "Score": "float32"}).sort_values("Score", ignore_index=True)
+
+
+@st.cache_data
+def load_states():
+    return pd.read_csv("data/states.csv", dtype={"State": "string", "Score": "float32", "Abbreviation": "string"}).sort_values("Score", ignore_index=True)
+
+
+# The choropleths only depend on the static ranking tables, so each figure
+# is built once and shared by every rerun and session. Scores are rounded
+# back to two decimals after widening them from float32.
+@st.cache_resource
+def load_world_map():
+    countries = load_countries()
+    go = load_graph_objects()
+    return go.Figure(
+        go.Choropleth(
+            locations=countries["Code"].to_numpy(),
+            z=countries["Score"].to_numpy(dtype=np.float64).round(2),
+            hovertext=countries["Country"].to_numpy(),
+            hovertemplate="<b>%{hovertext}</b><br><br>Code=%{location}<br>Score=%{z}<extra></extra>",
+            colorscale="Viridis",
+            zmin=3,
+            zmax=4,
+            colorbar={"title": {"text": "Score"}},
+        ),
+        layout={"margin": {"t": 60}},
+    )
+
+
+@st.cache_resource
+def load_states_map():
+    states = load_states()
+    go = load_graph_objects()
+    return go.Figure(
+        go.Choropleth(
+            locations=states["Abbreviation"].to_numpy(),
+            locationmode="USA-states",
+            z=states["Score"].to_numpy(dtype=np.float64).round(2),
+            hovertext=states["State"].to_numpy(),
+            hovertemplate="<b>%{hovertext}</b><br><br>Abbreviation=%{location}<br>Score=%{z}<extra></extra>",
+            colorscale="Viridis",
+            zmin=3,
+            zmax=4,
+            colorbar={"title": {"text": "Score"}},
+        ),
+        layout={"geo": {"scope": "usa"}, "margin": {"t": 60}},
+    )
+
+
+# Share of every Wordle game finished on each try
+TRIES_LABELS = ["1st", "2nd", "3rd", "4th", "5th", "6th", "Loss"]
+TRIES_PERCENTS = [0.08, 4.61, 24.68, 37.27, 24.86, 7.98, 2.65]
+
+
+# Vega-Lite specs for the bar charts, handed straight to st.vega_lite_chart.
+# The tries chart carries its own data, since it never changes
+TRIES_CHART_SPEC = {
+    "data": {"values": [{"Tries": label, "Percentage": percent} for label, percent in zip(TRIES_LABELS, TRIES_PERCENTS)]},
+    "mark": "bar",
+    "encoding": {
+        "x": {"field": "Tries", "type": "nominal"},
+        "y": {"field": "Percentage", "type": "quantitative"},
+    },
+}
+
+GLOBAL_CITIES_CHART_SPEC = {
+    "mark": "bar",
+    "height": 500,
+    "encoding": {
+        "x": {"field": "Score", "type": "quantitative", "scale": {"domain": [3.5, 3.72], "clamp": True}},
+        "y": {"field": "City", "type": "ordinal", "sort": "x", "axis": {"labelLimit": 200}},
+    },
+}
+
+US_CITIES_CHART_SPEC = {
+    "mark": "bar",
+    "height": 500,
+    "encoding": {
+        "x": {"field": "Score", "type": "quantitative", "scale": {"domain": [3.5, 3.67], "clamp": True}},
+        "y": {"field": "City", "type": "ordinal", "sort": "x"},
+    },
+}
+
+
+# Shown when the prediction falls between two scores of a ranking
+BETWEEN_MESSAGE = "The predicted score of your word is **higher than {lower_name}'s score ({lower_score!s})** and **lower than {higher_name}'s score ({higher_score!s})**.  \n"
+
+
+# Every ranking section of the Forest tab as (heading, description, loader,
+# name column, messages for a prediction above / below / between its scores,
+# chart call)
+RANKINGS = (
+    ("Global ranking",
+     "The below chart shows a map of the world organized by the **average scores of each country**.",
+     load_countries, "Country",
+     ("The predicted score of your word is **higher** than all of the countries around the world.  \n Broadly speaking, your word may be difficult to guess around the world!  \n",
+      "The predicted score of your word is **lower** than all of the countries around the world.  \n Broadly speaking, your word may be easy to guess around the world! \n",
+      BETWEEN_MESSAGE),
+     lambda ranking: st.plotly_chart(load_world_map())),
+    ("Global city ranking",
+     "The below chart shows the **10 cities worldwide with the best scores**.",
+     load_global_cities, "City",
+     ("The predicted score of your word is **higher** than all of the scores of the top 10 global cities.  \n Maybe you can stump them!  \n",
+      "The predicted score of your word is **lower** than all of the scores of the top 10 global cities.  \n How easily they can guess your word?  \n",
+      BETWEEN_MESSAGE),
+     lambda ranking: st.vega_lite_chart(ranking, GLOBAL_CITIES_CHART_SPEC, use_container_width=True)),
+    ("United States state ranking",
+     "The below chart shows a map of the United States organized by the **average scores of each state**.",
+     load_states, "State",
+     ("The predicted score of your word is **higher** than all of the scores of each U.S. state.  \n Your word might be tough for the average American!  \n",
+      "The predicted score of your word is **lower** than all of the scores of each U.S. state.  \n Can the average American guess your word easily?  \n",
+      BETWEEN_MESSAGE),
+     lambda ranking: st.plotly_chart(load_states_map())),
+    ("United States city ranking",
+     "The below chart shows the **10 cities in the United States with the best scores**.",
+     load_us_cities, "City",
+     ("The predicted score of your word is **higher** than all of the scores of the top 10 U.S. cities.  \n Maybe you can stump them!  \n",
+      "The predicted score of your word is **lower** than all of the scores of the top 10 U.S. cities.  \n Wonder how easily they can guess your word?  \n",
+      BETWEEN_MESSAGE),
+     lambda ranking: st.vega_lite_chart(ranking, US_CITIES_CHART_SPEC, use_container_width=True)),
+)
+
+
 with forest:
     st.header("🎯 Score Predictor")
 
     # Load datasets
     @st.cache_data
     def load_forest_data():
-        tweets = pd.read_csv("data/tweets.zip")
-        words = pd.read_csv("data/words_freq.csv")
+        tweets = load_tweets()
+        words = load_words_freq()
         tweets["score"] = tweets["tweet_text"].str[11]
         tweets["score"] = pd.to_numeric(tweets['score'], errors='coerce')
         tweets.rename(columns={"wordle_id": "day"}, inplace=True)
@@ -854,24 +1203,13 @@ with forest:
         words["day"] = pd.to_numeric(words['day'], errors='coerce')
         freqs = pd.read_csv("data/letter-frequencies.csv")
         freqs = freqs[["Letter", "English"]]
-        freqs = freqs["English"].tolist()
+        freqs = freqs["English"].to_numpy()
         df = pd.merge(words, tweets, on='day')
         df.drop(columns=['tweet_id'], inplace=True)
-        averages = df.groupby("word", as_index=False)['score'].mean()
-        percents = [0.08, 4.61, 24.68, 37.27, 24.86, 7.98, 2.65]
-        labels = ["1st", "2nd", "3rd", "4th", "5th", "6th", "Loss"]
-        chart_data = pd.DataFrame(
-            {
-                "Tries": labels,
-                "Percentage": percents,
-            }
-        )
-        countries = pd.read_csv("data/countries.csv")
-        global_cities = pd.read_csv("data/top10_global_cities.csv")
-        us_cities = pd.read_csv("data/top10_us_cities.csv")
-        states = pd.read_csv("data/states.csv")
-        return freqs, df, averages, countries, chart_data, global_cities, us_cities, states
-    freqs, df, averages, countries, chart_data, global_cities, us_cities, states = load_forest_data()
+        # Mean score of each word, looked up directly by the word
+        averages = df.groupby("word")['score'].mean().to_dict()
+        return freqs, averages
+    freqs, averages = load_forest_data()
 
     # Load model
     @st.cache_resource
@@ -895,7 +1233,7 @@ with forest:
             # For any given word:
             #    1. Put the word in lower case
             #    2. Extract each letter in the word and make it it's own column
-            #    3. Convert to ASCII number using ord() function
+            #    3. Convert to ASCII number by reading the word's bytes
             #    4. subtract 97 to simplify char to number representation (a = 0, b = 1, c = 2, ...)
             #    5. get frequency of each character using number representation as index to frequency array 
             with st.spinner("Running random forest..."):
@@ -905,25 +1243,14 @@ with forest:
                     if (not word.isalpha() or len(word) != 5):
                         raise Exception(
                             "Invalid word format. Please enter a five letter word using only alphabetic characters.")
-                    df = pd.DataFrame()
-                    df["word"] = [word]
-                    df["letter_1"] = df["word"].str.lower().str[0].apply(ord) - 97
-                    df["letter_2"] = df["word"].str.lower().str[1].apply(ord) - 97
-                    df["letter_3"] = df["word"].str.lower().str[2].apply(ord) - 97
-                    df["letter_4"] = df["word"].str.lower().str[3].apply(ord) - 97
-                    df["letter_5"] = df["word"].str.lower().str[4].apply(ord) - 97
-                    df["freq"] =    freqs[df["letter_1"][0]] + \
-                                    freqs[df["letter_2"][0]] + \
-                                    freqs[df["letter_3"][0]] + \
-                                    freqs[df["letter_4"][0]] + \
-                                    freqs[df["letter_5"][0]]
-                    df.drop(columns=["word"], inplace=True)
+                    # Every letter's ASCII code minus 97, read straight from the word's bytes
+                    letters = np.frombuffer(word.lower().encode('ascii'), dtype=np.uint8).astype(np.int64) - 97
+                    features = np.append(letters, freqs[letters].sum())
+                    df = pd.DataFrame([features], columns=["letter_1", "letter_2", "letter_3", "letter_4", "letter_5", "freq"])
                     return model.predict(df)
                 prediction = predict_score(word)
                 # If word isn't found in tweet data, None is returned for the average score
-                average = None
-                if word in averages["word"].values:
-                    average = averages[averages["word"] == word]["score"].item()
+                average = averages.get(word)
                 st.subheader(f"Results for {word.upper()}:")
                 col1, col2= st.columns(2)
                 with col1:
@@ -947,81 +1274,32 @@ with forest:
                     st.markdown("The average Wordle score is **3.83**. Looks like the average person should be able to figure this one out.")
                 st.markdown("**Refer to the chart below to see the percentage breakdown for the results of every Wordle game!**")
 
-                c = alt.Chart(chart_data).mark_bar().encode(x='Tries', y='Percentage')
-                st.altair_chart(c, use_container_width=True) 
+                st.vega_lite_chart(spec=TRIES_CHART_SPEC, use_container_width=True)
                 st.subheader("🌎 Your word vs. the world")
 
                 @st.cache_data
                 def get_bounds(scores, names, prediction):
-                    if prediction > max(scores):
-                        return None, float('inf')
-                    elif prediction < min(scores):
-                        return float('-inf'), None
-                    
-                    idx = np.argsort(scores)
-                    names = np.array(names)[idx]
-                    scores.sort()
-                    higher = float('inf')
-                    lower = float('-inf')
-                    for i in range(len(scores)):
-                        if scores[i] > prediction and scores[i] < higher:
-                            higher = i
-                        if scores[i] < prediction and scores[i] > lower:
-                            lower = i
-                    return higher, lower
-
-                st.markdown("### Global ranking")
-                st.markdown("The below chart shows a map of the world organized by the **average scores of each country**.")
-                names = countries["Country"].tolist()
-                scores = countries["Score"].tolist()
-                higher, lower = get_bounds(scores, names, prediction)
-                if higher == None:
-                    st.markdown("The predicted score of your word is **higher** than all of the countries around the world.  \n Broadly speaking, your word may be difficult to guess around the world!  \n")
-                elif lower == None:
-                    st.markdown("The predicted score of your word is **lower** than all of the countries around the world.  \n Broadly speaking, your word may be easy to guess around the world! \n")
-                else:
-                    st.markdown(f"The predicted score of your word is **higher than {names[lower]}'s score ({scores[lower]})** and **lower than {names[higher]}'s score ({scores[higher]})**.  \n")
-                fig = px.choropleth(countries, locations="Code", color="Score", color_continuous_scale="Viridis", hover_name="Country", range_color=(3, 4))
-                st.plotly_chart(fig)
-                st.markdown("### Global city ranking")
-                st.markdown("The below chart shows the **10 cities worldwide with the best scores**.")
-                scores = global_cities["Score"].tolist()
-                names = global_cities["City"].tolist()
-                higher, lower = get_bounds(scores, names, prediction)
-                if higher == None:
-                    st.markdown("The predicted score of your word is **higher** than all of the scores of the top 10 global cities.  \n Maybe you can stump them!  \n")
-                elif lower == None:
-                    st.markdown("The predicted score of your word is **lower** than all of the scores of the top 10 global cities.  \n How easily they can guess your word?  \n")
-                else:
-                    st.markdown(f"The predicted score of your word is **higher than {names[lower]}'s score ({scores[lower]})** and **lower than {names[higher]}'s score ({scores[higher]})**.  \n")
-                c = alt.Chart(global_cities).mark_bar().encode(x=alt.X('Score:Q', scale=alt.Scale(domain=(3.5, 3.72), clamp=True)), y=alt.Y('City:O', axis=alt.Axis(labelLimit=200)).sort('x'))
-                st.altair_chart(c.properties(height = 500), use_container_width=True) 
-                st.markdown("### United States state ranking")
-                st.markdown("The below chart shows a map of the United States organized by the **average scores of each state**.")
-                names = states["State"].tolist()
-                scores = states["Score"].tolist()
-                higher, lower = get_bounds(scores, names, prediction)
-                if higher == None:
-                    st.markdown("The predicted score of your word is **higher** than all of the scores of each U.S. state.  \n Your word might be tough for the average American!  \n")
-                elif lower == None:
-                    st.markdown("The predicted score of your word is **lower** than all of the scores of each U.S. state.  \n Can the average American guess your word easily?  \n")
-                else:
-                    st.markdown(f"The predicted score of your word is **higher than {names[lower]}'s score ({scores[lower]})** and **lower than {names[higher]}'s score ({scores[higher]})**.  \n")
-                fig = px.choropleth(states, locations="Abbreviation", locationmode="USA-states", color="Score", scope="usa", hover_name="State", color_continuous_scale="Viridis", range_color=(3, 4),)
-                st.plotly_chart(fig)
-                st.markdown("### United States city ranking")
-                st.markdown("The below chart shows the **10 cities in the United States with the best scores**.")
-                names = us_cities["City"].tolist()
-                scores = us_cities["Score"].tolist()
-                higher, lower = get_bounds(scores, names, prediction)
-                if higher == None:
-                    st.markdown("The predicted score of your word is **higher** than all of the scores of the top 10 U.S. cities.  \n Maybe you can stump them!  \n")
-                elif lower == None:
-                    st.markdown("The predicted score of your word is **lower** than all of the scores of the top 10 U.S. cities.  \n Wonder how easily they can guess your word?  \n")
-                else:
-                    st.markdown(f"The predicted score of your word is **higher than {names[lower]}'s score ({scores[lower]})** and **lower than {names[higher]}'s score ({scores[higher]})**.  \n")
-                c = alt.Chart(us_cities).mark_bar().encode(x=alt.X('Score:Q', scale=alt.Scale(domain=(3.5, 3.67), clamp=True)), y=alt.Y('City:O').sort('x'))
-                st.altair_chart(c.properties(height = 500), use_container_width=True) 
+                    # Picks the ranking message and its neighbours from the sorted scores
+                    prediction = np.float32(prediction)
+                    if prediction >= scores[-1]:
+                        return 0, {}
+                    elif prediction <= scores[0]:
+                        return 1, {}
+
+                    # Binary search for the closest scores strictly above and below the prediction
+                    higher = np.searchsorted(scores, prediction, side='right')
+                    lower = np.searchsorted(scores, prediction, side='left') - 1
+                    return 2, dict(lower_name=names[lower], lower_score=scores[lower], higher_name=names[higher], higher_score=scores[higher])
+
+                for title, description, load_ranking, name_column, messages, show_chart in RANKINGS:
+                    ranking = load_ranking()
+                    st.markdown(f"### {title}")
+                    st.markdown(description)
+                    names = ranking[name_column].to_numpy()
+                    scores = ranking["Score"].to_numpy()
+                    message, bounds = get_bounds(scores, names, prediction[0])
+                    st.markdown(messages[message].format(**bounds))
+                    show_chart(ranking)
 
 with rag:
     # Load environment variables
@@ -1046,6 +1324,14 @@ with rag:
     @st.cache_resource
     def initialize_qa_chain():
         try:
+            # langchain is slow to import and only needed by this tab, so it
+            # is imported the first time the chain is built
+            from langchain_openai import ChatOpenAI
+            from langchain.chains import RetrievalQA
+            from langchain_community.vectorstores import FAISS
+            from langchain_community.document_loaders import PyPDFLoader
+            from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings  # Updated import
+
             # Get the absolute path to the PDF relative to the script
             script_dir = os.path.dirname(os.path.abspath(__file__))
             pdfpath = os.path.join(
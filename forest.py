@@ -7,10 +7,7 @@ import datetime as dt
 import streamlit as st
 import itertools as it
 from datetime import datetime
-from scipy.stats import entropy
 import pickle
-import altair as alt
-import plotly.express as px
 from dotenv import load_dotenv
 import gc
 import logging
@@ -22,6 +19,154 @@ st.set_page_config(
 
 st.logo('captures/cheatdle.png')
 
+
+# plotly is slow to import and only needed once a word has been entered,
+# so its modules are imported on first use and shared from then on
+@st.cache_resource
+def load_graph_objects():
+    import plotly.graph_objects as go
+    return go
+
+
+# The ranking tables are read with their column types given up front and
+# sorted by score once when loaded, so that get_bounds can binary search
+# their scores as they are
+@st.cache_data
+def load_countries():
+    return pd.read_csv("data/countries.csv", dtype={"Country": "string", "Score": "float32", "Code": "string"}).sort_values("Score", ignore_index=True)
+
+
+@st.cache_data
+def load_global_cities():
+    return pd.read_csv("data/top10_global_cities.csv", dtype={"City": "string", "Score": "float32"}).sort_values("Score", ignore_index=True)
+
+
+@st.cache_data
+def load_us_cities():
+    return pd.read_csv("data/top10_us_cities.csv", dtype={"City": "string", "Score": "float32"}).sort_values("Score", ignore_index=True)
+
+
+@st.cache_data
+def load_states():
+    return pd.read_csv("data/states.csv", dtype={"State": "string", "Score": "float32", "Abbreviation": "string"}).sort_values("Score", ignore_index=True)
+
+
+# The choropleths only depend on the static ranking tables, so each figure
+# is built once and shared by every rerun and session. Scores are rounded
+# back to two decimals after widening them from float32.
+@st.cache_resource
+def load_world_map():
+    countries = load_countries()
+    go = load_graph_objects()
+    return go.Figure(
+        go.Choropleth(
+            locations=countries["Code"].to_numpy(),
+            z=countries["Score"].to_numpy(dtype=np.float64).round(2),
+            hovertext=countries["Country"].to_numpy(),
+            hovertemplate="<b>%{hovertext}</b><br><br>Code=%{location}<br>Score=%{z}<extra></extra>",
+            colorscale="Viridis",
+            zmin=3,
+            zmax=4,
+            colorbar={"title": {"text": "Score"}},
+        ),
+        layout={"margin": {"t": 60}},
+    )
+
+
+@st.cache_resource
+def load_states_map():
+    states = load_states()
+    go = load_graph_objects()
+    return go.Figure(
+        go.Choropleth(
+            locations=states["Abbreviation"].to_numpy(),
+            locationmode="USA-states",
+            z=states["Score"].to_numpy(dtype=np.float64).round(2),
+            hovertext=states["State"].to_numpy(),
+            hovertemplate="<b>%{hovertext}</b><br><br>Abbreviation=%{location}<br>Score=%{z}<extra></extra>",
+            colorscale="Viridis",
+            zmin=3,
+            zmax=4,
+            colorbar={"title": {"text": "Score"}},
+        ),
+        layout={"geo": {"scope": "usa"}, "margin": {"t": 60}},
+    )
+
+
+# Share of every Wordle game finished on each try
+TRIES_LABELS = ["1st", "2nd", "3rd", "4th", "5th", "6th", "Loss"]
+TRIES_PERCENTS = [0.08, 4.61, 24.68, 37.27, 24.86, 7.98, 2.65]
+
+
+# Vega-Lite specs for the bar charts, handed straight to st.vega_lite_chart.
+# The tries chart carries its own data, since it never changes
+TRIES_CHART_SPEC = {
+    "data": {"values": [{"Tries": label, "Percentage": percent} for label, percent in zip(TRIES_LABELS, TRIES_PERCENTS)]},
+    "mark": "bar",
+    "encoding": {
+        "x": {"field": "Tries", "type": "nominal"},
+        "y": {"field": "Percentage", "type": "quantitative"},
+    },
+}
+
+GLOBAL_CITIES_CHART_SPEC = {
+    "mark": "bar",
+    "height": 500,
+    "encoding": {
+        "x": {"field": "Score", "type": "quantitative", "scale": {"domain": [3.5, 3.72], "clamp": True}},
+        "y": {"field": "City", "type": "ordinal", "sort": "x", "axis": {"labelLimit": 200}},
+    },
+}
+
+US_CITIES_CHART_SPEC = {
+    "mark": "bar",
+    "height": 500,
+    "encoding": {
+        "x": {"field": "Score", "type": "quantitative", "scale": {"domain": [3.5, 3.67], "clamp": True}},
+        "y": {"field": "City", "type": "ordinal", "sort": "x"},
+    },
+}
+
+
+# Shown when the prediction falls between two scores of a ranking
+BETWEEN_MESSAGE = "The predicted score of your word is **higher than {lower_name}'s score ({lower_score!s})** and **lower than {higher_name}'s score ({higher_score!s})**.  \n"
+
+
+# Every ranking section of the Forest tab as (heading, description, loader,
+# name column, messages for a prediction above / below / between its scores,
+# chart call)
+RANKINGS = (
+    ("Global ranking",
+     "The below chart shows a map of the world organized by the **average scores of each country**.",
+     load_countries, "Country",
+     ("The predicted score of your word is **higher** than all of the countries around the world.  \n Broadly speaking, your word may be difficult to guess around the world!  \n",
+      "The predicted score of your word is **lower** than all of the countries around the world.  \n Broadly speaking, your word may be easy to guess around the world! \n",
+      BETWEEN_MESSAGE),
+     lambda ranking: st.plotly_chart(load_world_map())),
+    ("Global city ranking",
+     "The below chart shows the **10 cities worldwide with the best scores**.",
+     load_global_cities, "City",
+     ("The predicted score of your word is **higher** than all of the scores of the top 10 global cities.  \n Maybe you can stump them!  \n",
+      "The predicted score of your word is **lower** than all of the scores of the top 10 global cities.  \n How easily they can guess your word?  \n",
+      BETWEEN_MESSAGE),
+     lambda ranking: st.vega_lite_chart(ranking, GLOBAL_CITIES_CHART_SPEC, use_container_width=True)),
+    ("United States state ranking",
+     "The below chart shows a map of the United States organized by the **average scores of each state**.",
+     load_states, "State",
+     ("The predicted score of your word is **higher** than all of the scores of each U.S. state.  \n Your word might be tough for the average American!  \n",
+      "The predicted score of your word is **lower** than all of the scores of each U.S. state.  \n Can the average American guess your word easily?  \n",
+      BETWEEN_MESSAGE),
+     lambda ranking: st.plotly_chart(load_states_map())),
+    ("United States city ranking",
+     "The below chart shows the **10 cities in the United States with the best scores**.",
+     load_us_cities, "City",
+     ("The predicted score of your word is **higher** than all of the scores of the top 10 U.S. cities.  \n Maybe you can stump them!  \n",
+      "The predicted score of your word is **lower** than all of the scores of the top 10 U.S. cities.  \n Wonder how easily they can guess your word?  \n",
+      BETWEEN_MESSAGE),
+     lambda ranking: st.vega_lite_chart(ranking, US_CITIES_CHART_SPEC, use_container_width=True)),
+)
+
+
 st.header("🎯 Score Predictor")
 # Load datasets
 st.markdown(
@@ -48,25 +193,14 @@ if word:
             words["day"] = pd.to_numeric(words['day'], errors='coerce')
             freqs = pd.read_csv("data/letter-frequencies.csv")
             freqs = freqs[["Letter", "English"]]
-            freqs = freqs["English"].tolist()
+            freqs = freqs["English"].to_numpy()
             df = pd.merge(words, tweets, on='day')
             df.drop(columns=['tweet_id'], inplace=True)
-            averages = df.groupby("word", as_index=False)['score'].mean()
-
-            percents = [0.08, 4.61, 24.68, 37.27, 24.86, 7.98, 2.65]
-            labels = ["1st", "2nd", "3rd", "4th", "5th", "6th", "Loss"]
-            chart_data = pd.DataFrame(
-                {
-                    "Tries": labels,
-                    "Percentage": percents,
-                }
-            )
-            countries = pd.read_csv("data/countries.csv")
-            global_cities = pd.read_csv("data/top10_global_cities.csv")
-            us_cities = pd.read_csv("data/top10_us_cities.csv")
-            states = pd.read_csv("data/states.csv")
-            return df, freqs, averages, chart_data, countries, global_cities, us_cities, states
-        df, freqs, averages, chart_data, countries, global_cities, us_cities, states = load_data()
+            # Mean score of each word, looked up directly by the word
+            averages = df.groupby("word")['score'].mean().to_dict()
+
+            return freqs, averages
+        freqs, averages = load_data()
 
         @st.cache_resource
         def load_model():
@@ -79,7 +213,7 @@ if word:
         # For any given word:
         #    1. Put the word in lower case
         #    2. Extract each letter in the word and make it it's own column
-        #    3. Convert to ASCII number using ord() function
+        #    3. Convert to ASCII number by reading the word's bytes
         #    4. subtract 97 to simplify char to number representation (a = 0, b = 1, c = 2, ...)
         #    5. Use number representation as index in frequency array
 
@@ -87,26 +221,15 @@ if word:
             if (not word.isalpha() or len(word) != 5):
                 raise Exception(
                     "Invalid word format. Please enter a five letter word using only alphabetic characters.")
-            df = pd.DataFrame()
-            df["word"] = [word]
-            df["letter_1"] = df["word"].str.lower().str[0].apply(ord) - 97
-            df["letter_2"] = df["word"].str.lower().str[1].apply(ord) - 97
-            df["letter_3"] = df["word"].str.lower().str[2].apply(ord) - 97
-            df["letter_4"] = df["word"].str.lower().str[3].apply(ord) - 97
-            df["letter_5"] = df["word"].str.lower().str[4].apply(ord) - 97
-            df["freq"] =    freqs[df["letter_1"][0]] + \
-                            freqs[df["letter_2"][0]] + \
-                            freqs[df["letter_3"][0]] + \
-                            freqs[df["letter_4"][0]] + \
-                            freqs[df["letter_5"][0]]
-            df.drop(columns=["word"], inplace=True)
+            # Every letter's ASCII code minus 97, read straight from the word's bytes
+            letters = np.frombuffer(word.lower().encode('ascii'), dtype=np.uint8).astype(np.int64) - 97
+            features = np.append(letters, freqs[letters].sum())
+            df = pd.DataFrame([features], columns=["letter_1", "letter_2", "letter_3", "letter_4", "letter_5", "freq"])
             return model.predict(df)
         
         prediction = predict_score(word)
         # If word isn't found in tweet data, None is returned for the average score
-        average = None
-        if word in averages["word"].values:
-            average = averages[averages["word"] == word]["score"].item()
+        average = averages.get(word)
         st.subheader(f"Results for '{word}':")
         col1, col2= st.columns(2)
         with col1:
@@ -130,77 +253,28 @@ if word:
             st.markdown("The average Wordle score is **3.83**. Looks like the average person should be able to figure this one out.")
         st.markdown("**Refer to the chart below to see the percentage breakdown for the results of every Wordle game!**")
 
-        c = alt.Chart(chart_data).mark_bar().encode(x='Tries', y='Percentage')
-        st.altair_chart(c, use_container_width=True) 
+        st.vega_lite_chart(spec=TRIES_CHART_SPEC, use_container_width=True)
         st.subheader("🌎 Your word vs. the world")
 
         def get_bounds(scores, names, prediction):
-            if prediction > max(scores):
-                return None, float('inf')
-            elif prediction < min(scores):
-                return float('-inf'), None
-            
-            idx = np.argsort(scores)
-            names = np.array(names)[idx]
-            scores.sort()
-            higher = float('inf')
-            lower = float('-inf')
-            for i in range(len(scores)):
-                if scores[i] > prediction and scores[i] < higher:
-                    higher = i
-                if scores[i] < prediction and scores[i] > lower:
-                    lower = i
-            return higher, lower
-
-        st.markdown("### Global ranking")
-        st.markdown("The below chart shows a map of the world organized by the **average scores of each country**.")
-        names = countries["Country"].tolist()
-        scores = countries["Score"].tolist()
-        higher, lower = get_bounds(scores, names, prediction)
-        if higher == None:
-            st.markdown("The predicted score of your word is **higher** than all of the countries around the world.  \n Broadly speaking, your word may be difficult to guess around the world!  \n")
-        elif lower == None:
-            st.markdown("The predicted score of your word is **lower** than all of the countries around the world.  \n Broadly speaking, your word may be easy to guess around the world! \n")
-        else:
-            st.markdown(f"The predicted score of your word is **higher than {names[lower]}'s score ({scores[lower]})** and **lower than {names[higher]}'s score ({scores[higher]})**.  \n")
-        fig = px.choropleth(countries, locations="Code", color="Score", color_continuous_scale="Viridis", hover_name="Country", range_color=(3, 4))
-        st.plotly_chart(fig)
-        st.markdown("### Global city ranking")
-        st.markdown("The below chart shows the **10 cities worldwide with the best scores**.")
-        scores = global_cities["Score"].tolist()
-        names = global_cities["City"].tolist()
-        higher, lower = get_bounds(scores, names, prediction)
-        if higher == None:
-            st.markdown("The predicted score of your word is **higher** than all of the scores of the top 10 global cities.  \n Maybe you can stump them!  \n")
-        elif lower == None:
-            st.markdown("The predicted score of your word is **lower** than all of the scores of the top 10 global cities.  \n How easily they can guess your word?  \n")
-        else:
-            st.markdown(f"The predicted score of your word is **higher than {names[lower]}'s score ({scores[lower]})** and **lower than {names[higher]}'s score ({scores[higher]})**.  \n")
-        c = alt.Chart(global_cities).mark_bar().encode(x=alt.X('Score:Q', scale=alt.Scale(domain=(3.5, 3.72), clamp=True)), y=alt.Y('City:O', axis=alt.Axis(labelLimit=200)).sort('x'))
-        st.altair_chart(c.properties(height = 500), use_container_width=True) 
-        st.markdown("### United States state ranking")
-        st.markdown("The below chart shows a map of the United States organized by the **average scores of each state**.")
-        names = states["State"].tolist()
-        scores = states["Score"].tolist()
-        higher, lower = get_bounds(scores, names, prediction)
-        if higher == None:
-            st.markdown("The predicted score of your word is **higher** than all of the scores of each U.S. state.  \n Your word might be tough for the average American!  \n")
-        elif lower == None:
-            st.markdown("The predicted score of your word is **lower** than all of the scores of each U.S. state.  \n Can the average American guess your word easily?  \n")
-        else:
-            st.markdown(f"The predicted score of your word is **higher than {names[lower]}'s score ({scores[lower]})** and **lower than {names[higher]}'s score ({scores[higher]})**.  \n")
-        fig = px.choropleth(states, locations="Abbreviation", locationmode="USA-states", color="Score", scope="usa", hover_name="State", color_continuous_scale="Viridis", range_color=(3, 4),)
-        st.plotly_chart(fig)
-        st.markdown("### United States city ranking")
-        st.markdown("The below chart shows the **10 cities in the United States with the best scores**.")
-        names = us_cities["City"].tolist()
-        scores = us_cities["Score"].tolist()
-        higher, lower = get_bounds(scores, names, prediction)
-        if higher == None:
-            st.markdown("The predicted score of your word is **higher** than all of the scores of the top 10 U.S. cities.  \n Maybe you can stump them!  \n")
-        elif lower == None:
-            st.markdown("The predicted score of your word is **lower** than all of the scores of the top 10 U.S. cities.  \n Wonder how easily they can guess your word?  \n")
-        else:
-            st.markdown(f"The predicted score of your word is **higher than {names[lower]}'s score ({scores[lower]})** and **lower than {names[higher]}'s score ({scores[higher]})**.  \n")
-        c = alt.Chart(us_cities).mark_bar().encode(x=alt.X('Score:Q', scale=alt.Scale(domain=(3.5, 3.67), clamp=True)), y=alt.Y('City:O').sort('x'))
-        st.altair_chart(c.properties(height = 500), use_container_width=True) 
\ No newline at end of file
+            # Picks the ranking message and its neighbours from the sorted scores
+            prediction = np.float32(prediction)
+            if prediction >= scores[-1]:
+                return 0, {}
+            elif prediction <= scores[0]:
+                return 1, {}
+
+            # Binary search for the closest scores strictly above and below the prediction
+            higher = np.searchsorted(scores, prediction, side='right')
+            lower = np.searchsorted(scores, prediction, side='left') - 1
+            return 2, dict(lower_name=names[lower], lower_score=scores[lower], higher_name=names[higher], higher_score=scores[higher])
+
+        for title, description, load_ranking, name_column, messages, show_chart in RANKINGS:
+            ranking = load_ranking()
+            st.markdown(f"### {title}")
+            st.markdown(description)
+            names = ranking[name_column].to_numpy()
+            scores = ranking["Score"].to_numpy()
+            message, bounds = get_bounds(scores, names, prediction[0])
+            st.markdown(messages[message].format(**bounds))
+            show_chart(ranking)
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+import re
 import json
 import random
 import numpy as np
@@ -10,9 +11,7 @@ from textblob import TextBlob
 from datetime import datetime
 from dotenv import load_dotenv
 import gc
-import torch
 import logging
-import plotly.express as px
 
 # Existing imports, plus new RAG-specific imports
 
@@ -23,6 +22,14 @@ st.set_page_config(
 
 st.logo('captures/cheatdle.png')
 
+# plotly.express is slow to import and only needed once a word has been
+# entered, so it is imported on first use and shared from then on
+@st.cache_resource
+def load_plotly():
+    import plotly.express as px
+    return px
+
+
 st.header("🚀 Sentiment Analysis")
 st.markdown(
     """
@@ -31,10 +38,23 @@ st.markdown(
     """
 )
 
+# Lines of a tweet which belong to the shared Wordle grid
+GRID_LINE = re.compile(r'\s*(?:Wordle|⬛|⬜|🟨|🟩)')
+
 # Load datasets
+@st.cache_data
+def load_tweets():
+    return pd.read_csv("data/tweets.zip")
+
+
+@st.cache_data
+def load_words_freq():
+    return pd.read_csv("data/words_freq.csv")
+
+
 try:
-    words_freq = pd.read_csv("data/words_freq.csv")
-    tweets = pd.read_csv("data/tweets.zip")
+    words_freq = load_words_freq()
+    tweets = load_tweets()
 except FileNotFoundError as e:
     st.error(f"Error: {e}. Ensure the file paths are correct.")
     st.stop()
@@ -63,31 +83,23 @@ if word:
                 st.success(f"Analyzing tweets for Wordle #{wordle_day}...")
 
                 # Sentiment Analysis
-                sentiments = {"positive": 0, "neutral": 0, "negative": 0}
-                polarity_scores = []
-
-                for _, row in wordle_tweets.iterrows():
-                    text = row["tweet_text"]
-                    # Skip grid-only tweets
-                    if text.count('\n') <= 1 and text.startswith("Wordle"):
-                        continue
-
-                    cleaned_text = ' '.join([
-                        line for line in text.split('\n')
-                        if not line.strip().startswith(('Wordle', '⬛', '⬜', '🟨', '🟩'))
-                    ])
-
-                    if cleaned_text.strip():
-                        analysis = TextBlob(cleaned_text)
-                        polarity = analysis.sentiment.polarity
-                        polarity_scores.append(polarity)
-
-                        if polarity > 0:
-                            sentiments["positive"] += 1
-                        elif polarity < 0:
-                            sentiments["negative"] += 1
-                        else:
-                            sentiments["neutral"] += 1
+                texts = wordle_tweets["tweet_text"]
+                # Skip grid-only tweets
+                texts = texts[~(texts.str.startswith("Wordle") & (texts.str.count('\n') <= 1))]
+
+                # Drop the grid lines of each tweet and join the rest back up
+                lines = texts.str.split('\n').explode()
+                lines = lines[~lines.str.match(GRID_LINE)]
+                cleaned_texts = lines.groupby(level=0).agg(' '.join)
+                cleaned_texts = cleaned_texts[cleaned_texts.str.strip() != '']
+
+                polarity_scores = cleaned_texts.map(
+                    lambda text: TextBlob(text).sentiment.polarity).to_numpy(dtype=float)
+                sentiments = {
+                    "positive": int((polarity_scores > 0).sum()),
+                    "neutral": int((polarity_scores == 0).sum()),
+                    "negative": int((polarity_scores < 0).sum())
+                }
 
                 total = sum(sentiments.values())
 
@@ -112,7 +124,7 @@ if word:
                     # Sentiment Polarity Distribution
                     st.markdown("### Sentiment Polarity Distribution")
                     polarity_data = pd.DataFrame({"Polarity": polarity_scores})
-                    fig = px.histogram(
+                    fig = load_plotly().histogram(
                         polarity_data,
                         x="Polarity",
                         nbins=20,